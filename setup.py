@@ -8,7 +8,7 @@ setup(
     version=version,
     packages=find_packages(),
     install_requires=[
-        "torch>=2.0.0",
+        "torch>=2.1.0",
         "torchvision==0.19.1",
         "numpy",
         "tqdm",
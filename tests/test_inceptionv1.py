@@ -0,0 +1,172 @@
+import pytest
+import torch
+
+from torchlight.models import InceptionV1
+from torchlight.models.inceptionv1 import (
+    CatLayer,
+    ConvReLU2d,
+    RedirectedReLU,
+    _local_response_norm,
+)
+
+random_image = torch.randn(2, 3, 224, 224)
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return InceptionV1(pretrained=False, redirected_ReLU=False).eval()
+
+
+def test_fuse_conv_relu(model):
+    with torch.no_grad():
+        expected = model(random_image)
+        model.fuse_conv_relu()
+        out = model(random_image)
+    assert isinstance(model.mixed4a_1x1, torch.nn.Identity)
+    assert torch.allclose(out, expected, atol=1e-6), "Outputs are not equal"
+
+
+def test_fuse_for_inference(model):
+    with torch.no_grad():
+        expected = model(random_image)
+        out = model.fuse_for_inference()(random_image)
+    assert isinstance(model.mixed4d_3x3_pre_relu_conv, ConvReLU2d)
+    assert "mixed4d" in model._fused_branches
+    assert torch.allclose(out, expected, atol=1e-6), "Outputs are not equal"
+
+
+def test_fuse_conv_relu_redirected_relu():
+    model = InceptionV1(pretrained=False, redirected_ReLU=True)
+    with pytest.raises(ValueError):
+        model.fuse_conv_relu()
+
+
+def test_redirected_relu_gradient():
+    x = torch.tensor([-2.0, -0.5, 0.0, 0.5, 2.0], requires_grad=True)
+    out = RedirectedReLU.apply(x)
+    out.backward(torch.ones_like(out))
+    assert torch.equal(out, torch.relu(x.detach()))
+    assert torch.allclose(x.grad, torch.tensor([0.1, 0.1, 1.0, 1.0, 1.0]))
+
+
+@pytest.mark.parametrize("size", [28, 29])
+def test_max_pool_padding(model, size):
+    x = torch.randn(1, 8, size, size)
+    # reference: explicit -inf padding as in the original TensorFlow graph
+    expected_stride_2 = torch.nn.functional.max_pool2d(
+        torch.nn.functional.pad(x, (0, 1, 0, 1), value=float("-inf")), 3, 2
+    )
+    expected_stride_1 = torch.nn.functional.max_pool2d(
+        torch.nn.functional.pad(x, (1, 1, 1, 1), value=float("-inf")), 3, 1
+    )
+    assert torch.equal(model.maxpool4(x), expected_stride_2)
+    assert torch.equal(model.mixed4a_pool(x), expected_stride_1)
+
+
+@pytest.mark.parametrize("branch, pad", [("3x3", 1), ("5x5", 2)])
+def test_conv_padding(model, branch, pad):
+    conv = getattr(model, f"mixed4a_{branch}_pre_relu_conv")
+    x = torch.randn(1, conv.in_channels, 14, 14)
+    # reference: explicit zero padding as in the original TensorFlow graph
+    expected = torch.nn.functional.conv2d(
+        torch.nn.functional.pad(x, (pad, pad, pad, pad)), conv.weight, conv.bias
+    )
+    with torch.no_grad():
+        assert torch.allclose(conv(x), expected, atol=1e-5)
+
+
+def test_fuse_branches(model):
+    with torch.no_grad():
+        expected = model(random_image)
+        model.fuse_branches()
+        out = model(random_image)
+    assert "mixed4a_reduce_weight" not in model.state_dict()
+    assert torch.allclose(out, expected, atol=1e-6), "Outputs are not equal"
+
+
+def test_trace(model):
+    activations = []
+    model.mixed4a.register_forward_hook(lambda m, i, o: activations.append(o))
+    with torch.no_grad():
+        expected = model(random_image)
+        out = model.trace_()(random_image)
+    assert len(activations) == 2
+    assert torch.equal(activations[0], activations[1])
+    assert torch.allclose(out, expected, atol=1e-6), "Outputs are not equal"
+
+
+@pytest.mark.parametrize("grad", [True, False])
+def test_channels_last(model, grad):
+    activations = {}
+    for name in ["conv2d0", "mixed3a", "mixed4d_3x3", "mixed5b"]:
+        model.get_submodule(name).register_forward_hook(
+            lambda m, i, o, name=name: activations.__setitem__(name, o)
+        )
+    with torch.set_grad_enabled(grad):
+        model(random_image)
+    assert model.mixed4d_3x3_pre_relu_conv.weight.is_contiguous(
+        memory_format=torch.channels_last
+    )
+    for name, activation in activations.items():
+        assert activation.is_contiguous(memory_format=torch.channels_last), name
+
+
+def test_bfloat16_weights(model):
+    logits = []
+    model.softmax2_pre_activation_matmul.register_forward_hook(
+        lambda m, i, o: logits.append(o)
+    )
+    with torch.no_grad():
+        model(random_image)
+        out = model.bfloat16()(random_image)
+    assert out.dtype == torch.bfloat16
+    expected, out = logits[0], logits[1].float()
+    # bfloat16 keeps about 3 significant digits, compare the relative error of the logits
+    assert (out - expected).norm() / expected.norm() < 5e-2
+
+
+@pytest.mark.parametrize("beta", [0.5, 0.75])
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_local_response_norm(beta, dtype):
+    x = torch.randn(2, 16, 8, 8, dtype=dtype)
+    expected = torch.nn.functional.local_response_norm(
+        x, size=9, alpha=1e-4, beta=beta, k=1
+    )
+    out = _local_response_norm(x, size=9, alpha=1e-4, beta=beta, k=1)
+    assert out.dtype == dtype
+    atol = 1e-12 if dtype == torch.float64 else 1e-6
+    assert torch.allclose(out, expected, atol=atol), "Outputs are not equal"
+
+
+def test_graph_calls_every_layer(model):
+    called = {name for name, op, _ in model.graph if op is None}
+    assert called == {name for name, _ in model.named_children()}
+
+
+def test_cat_layer():
+    tensors = [torch.randn(2, channels, 4, 4) for channels in (64, 128, 32, 32)]
+    with torch.no_grad():
+        out = CatLayer()(*tensors)
+    assert out.is_contiguous(memory_format=torch.channels_last)
+    assert torch.equal(out, torch.cat(tensors, 1))
+
+
+def test_caller_autocast(model):
+    activations = []
+    model.conv2d0_pre_relu_conv.register_forward_hook(
+        lambda m, i, o: activations.append(o)
+    )
+    with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16):
+        model(random_image)
+    assert model.autocast_dtype is None
+    assert activations[0].dtype == torch.bfloat16
+
+
+def test_trace_then_move(model):
+    model.fuse_for_inference().trace_()
+    with torch.no_grad():
+        expected = model(random_image)
+        out = model.double()(random_image.double())
+    assert out.dtype == torch.float64
+    assert torch.allclose(out.float(), expected, atol=1e-5)
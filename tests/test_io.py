@@ -0,0 +1,138 @@
+import sys
+import PIL.Image
+import numpy as np
+import pytest
+import torch
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from torchlight import io
+from torchlight.io import (
+    _normalize_arrays,
+    load_images,
+    normalize_array,
+    save_images,
+)
+
+random_array = np.random.rand(32, 32, 3).astype(np.float32)
+
+
+def reference_normalize(array, domain):
+    # the element-wise steps of the original implementation
+    array = np.array(array, dtype=np.float64).clip(*domain)
+    array = (array - domain[0]) * (255 / (domain[1] - domain[0]))
+    return array.clip(0, 255).astype(np.uint8)
+
+
+def test_normalize_array():
+    array = random_array.copy()
+    out = normalize_array(array)
+    assert out.dtype == np.uint8
+    assert out.min() == 0 and out.max() == 255
+    assert np.array_equal(array, random_array), "The input was mutated"
+
+
+def test_normalize_array_domain():
+    array = random_array * 4 - 2
+    out = normalize_array(array, domain=(-1, 1))
+    expected = reference_normalize(array, (-1, 1))
+    assert np.abs(out.astype(int) - expected).max() <= 1
+
+
+def test_normalize_array_integer():
+    array = np.arange(-10, 310, dtype=np.int32).reshape(1, 10, 32)
+    out = normalize_array(array, domain=(0, 300))
+    assert out.shape == (10, 32)
+    assert np.array_equal(out, np.clip(array[0], 0, 255).astype(np.uint8))
+    # a domain entirely below 0 must not wrap around
+    out = normalize_array(array, domain=(-100, -50))
+    assert np.array_equal(out, np.zeros((10, 32), dtype=np.uint8))
+
+
+def test_normalize_arrays():
+    arrays = [random_array * i for i in range(1, 5)]
+    out = _normalize_arrays(arrays, domain=(0, 1))
+    expected = [normalize_array(array, domain=(0, 1)) for array in arrays]
+    assert all(np.array_equal(a, b) for a, b in zip(out, expected))
+
+
+def test_image_url_cache(monkeypatch):
+    monkeypatch.setattr(io, "_image_url_cache", OrderedDict())
+    monkeypatch.setattr(io, "_image_url_cache_bytes", 0)
+    calls = []
+    serialize_array = io.serialize_array
+    monkeypatch.setattr(
+        io,
+        "serialize_array",
+        lambda *a, **k: calls.append(1) or serialize_array(*a, **k),
+    )
+    url = io._image_url(random_array.copy(), domain=(0, 1))
+    assert io._image_url(random_array.copy(), domain=(0, 1)) == url
+    assert len(calls) == 1
+    io._image_url(random_array * 0.5, domain=(0, 1))
+    assert len(calls) == 2
+
+
+def test_load_images_as_tensor(tmp_path):
+    path = str(tmp_path / "image.png")
+    save_images([random_array], path, domain=(0, 1))
+    images = load_images([path, path], return_as_numpy=True)
+    out = load_images([path, path], return_as_tensor=True)
+    assert out.dtype == torch.uint8
+    assert torch.equal(out, torch.from_numpy(images).permute(0, 3, 1, 2))
+
+
+@pytest.mark.parametrize("extension", ["gif", "webp"])
+def test_save_animation(tmp_path, extension):
+    path = str(tmp_path / f"animation.{extension}")
+    save_images([random_array * i for i in range(1, 4)], path, domain=(0, 3), fps=4)
+    image = PIL.Image.open(path)
+    # the WebP plugin only reads the frame duration when the frame is loaded
+    image.load()
+    assert image.n_frames == 3
+    assert image.size == (32, 32)
+    assert image.info["duration"] == 250
+
+
+def test_normalize_array_nan():
+    array = random_array.copy()
+    array[3, 4, 1] = np.nan
+    with pytest.raises(AssertionError):
+        normalize_array(array)
+
+
+def test_normalize_array_uint8():
+    array = normalize_array(random_array)[None]
+    out = normalize_array(array)
+    assert not np.shares_memory(out, array)
+    assert np.array_equal(out, array[0])
+
+
+def test_serialize_jpeg_without_libturbojpeg(monkeypatch):
+    class TurboJPEG:
+        def __init__(self):
+            raise RuntimeError("Unable to locate turbojpeg library")
+
+    monkeypatch.setitem(sys.modules, "turbojpeg", SimpleNamespace(TurboJPEG=TurboJPEG))
+    io._turbo_jpeg.cache_clear()
+    try:
+        data = io._serialize_normalized_array(normalize_array(random_array), fmt="jpeg")
+    finally:
+        io._turbo_jpeg.cache_clear()
+    assert data[:2] == b"\xff\xd8"
+
+
+def test_image_url_cache_bytes(monkeypatch):
+    monkeypatch.setattr(io, "_image_url_cache", OrderedDict())
+    monkeypatch.setattr(io, "_image_url_cache_bytes", 0)
+    url = io._image_url(random_array, domain=(0, 1))
+    monkeypatch.setattr(io, "_image_url_cache", OrderedDict())
+    monkeypatch.setattr(io, "_image_url_cache_bytes", 0)
+    # room for a single URL of this size
+    monkeypatch.setattr(io, "IMAGE_URL_CACHE_BYTES", int(len(url) * 1.5))
+    io._image_url(random_array, domain=(0, 1))
+    io._image_url(random_array * 0.5, domain=(0, 1))
+    assert len(io._image_url_cache) == 1
+    assert io._image_url_cache_bytes == sum(map(len, io._image_url_cache.values()))
+    io._image_url(np.random.rand(64, 64, 3), domain=(0, 1))
+    assert len(io._image_url_cache) == 1, "URLs larger than the limit are not cached"
@@ -3,12 +3,16 @@
 # https://github.com/greentfrapp/lucent/blob/dev/lucent/misc/io/showing.py
 from .utils import create_simple_logger, T, A, DEVICE
 
+import os
 import torch
 import base64
+import hashlib
 import numpy as np
 import PIL.Image
 from io import BytesIO
-import IPython.display
+from collections import OrderedDict
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 from string import Template
 from typing import List, Optional, Tuple, Union
 
@@ -48,38 +52,76 @@ def normalize_array(array: A, domain: Optional[Tuple[float, float]] = None) -> A
     np.ndarray
         The normalized array.
     """
-    # first copy the input so we're never mutating the user's data
-    array = np.array(array)
     # squeeze helps both with batch=1 and B/W and PIL's mode inference
-    array = np.squeeze(array)
+    array = np.squeeze(np.asarray(array))
     assert len(array.shape) <= 3
     assert np.issubdtype(array.dtype, np.number)
-    assert not np.isnan(array).any()
+    # already normalized, e.g. frames loaded with `load_images` or normalized by `_normalize_arrays`
+    # a single copy instead of the float passes, so like the other paths the result never aliases the input
+    if array.dtype == np.uint8 and (domain is None or tuple(domain) == (0, 255)):
+        return array.copy()
 
     low, high = np.min(array), np.max(array)
+    # NaNs propagate through min and max, so this checks the whole array without another pass over it
+    assert not (np.isnan(low) or np.isnan(high))
     if domain is None:
         message = f"No domain specified, normalizing from measured range (~{low:.2f}, ~{high:.2f})."
         logger.debug(message)
         domain = (low, high)
 
-    # clip values if domain was specified and array contains values outside of it
+    # values outside of the domain are clipped below, along with the final clip to the uint8 range
     if low < domain[0] or high > domain[1]:
         message = f"Clipping domain from ({low:.2f}, {high:.2f}) to ({domain[0]}, {domain[1]})."
         logger.debug(message)
-        array = array.clip(*domain)
 
     min_value, max_value = np.iinfo(np.uint8).min, np.iinfo(np.uint8).max  # 0, 255
-    # convert signed to unsigned if needed
-    if np.issubdtype(array.dtype, np.inexact):
-        offset = domain[0]
-        if offset != 0:
-            array -= offset
-        if domain[0] != domain[1]:
-            scalar = max_value / (domain[1] - domain[0])
-            if scalar != 1:
-                array *= scalar
+    if not np.issubdtype(array.dtype, np.inexact):
+        array = np.clip(array, *domain)
+        return array.clip(min_value, max_value).astype(np.uint8)
 
-    return array.clip(min_value, max_value).astype(np.uint8)
+    # offset and scale into a new buffer, so the user's data is never mutated, then clip and cast it
+    scalar = max_value / (domain[1] - domain[0]) if domain[0] != domain[1] else 0.0
+    out = np.subtract(array, domain[0], dtype=np.result_type(array.dtype, np.float32))
+    out *= scalar
+    np.clip(out, min_value, max_value, out=out)
+    return out.astype(np.uint8)
+
+
+def _normalize_arrays(
+    arrays: List[A], domain: Optional[Tuple[float, float]] = None
+) -> List[A]:
+    """Normalizes a list of arrays with `normalize_array`, in parallel as NumPy releases the GIL.
+
+    Parameters
+    ----------
+    arrays : List[np.ndarray]
+        The arrays to normalize.
+    domain : Tuple[float, float], optional
+        The domain of the input arrays, by default None. If None, the domain will be inferred from each array.
+
+    Returns
+    -------
+    List[np.ndarray]
+        The normalized arrays.
+    """
+    normalize = partial(normalize_array, domain=domain)
+    max_workers = min(len(arrays), os.cpu_count() or 1)
+    if max_workers <= 1:
+        return [normalize(array) for array in arrays]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(normalize, arrays))
+
+
+@lru_cache(maxsize=None)
+def _turbo_jpeg():
+    """Returns a `TurboJPEG` encoder using the SIMD libjpeg-turbo library, or None if PyTurboJPEG or libturbojpeg is not installed."""
+    try:
+        from turbojpeg import TurboJPEG
+
+        # raises if the wheel is installed without the libturbojpeg shared library
+        return TurboJPEG()
+    except (ImportError, OSError, RuntimeError):
+        return None
 
 
 def _serialize_normalized_array(
@@ -106,9 +148,17 @@ def _serialize_normalized_array(
     assert np.max(array) <= np.iinfo(dtype).max
     assert array.shape[-1] > 1  # array dims must have been squeezed
 
+    if fmt.lower() in ("jpeg", "jpg") and array.ndim == 3 and array.shape[-1] == 3:
+        turbo_jpeg = _turbo_jpeg()
+        if turbo_jpeg is not None:
+            from turbojpeg import TJPF_RGB
+
+            return turbo_jpeg.encode(array, quality=quality, pixel_format=TJPF_RGB)
+
     image = PIL.Image.fromarray(array)
     image_bytes = BytesIO()
-    image.save(image_bytes, fmt, quality=quality)
+    # the images are only displayed, so favour encoding speed over size for PNGs
+    image.save(image_bytes, fmt, quality=quality, compress_level=1)
     image_data = image_bytes.getvalue()
     return image_data
 
@@ -121,6 +171,8 @@ def numpy_image_to_video(
 ) -> None:
     """Save a list of images as an MP4 video.
 
+    The frames are piped to ffmpeg and encoded with libx264 if `imageio-ffmpeg` is installed, otherwise they are written with OpenCV.
+
     Parameters
     ----------
     images : List[np.ndarray]
@@ -130,17 +182,37 @@ def numpy_image_to_video(
     filename : str, optional
         The path to save the video, by default 'output.mp4'.
     """
-    images = [normalize_array(image, domain=domain) for image in images]
+    images = _normalize_arrays(images, domain=domain)
+    frames = np.stack(images)
+    _, h, w, _ = frames.shape
+
+    try:
+        import imageio_ffmpeg
+    except ImportError:
+        imageio_ffmpeg = None
+
+    if imageio_ffmpeg is not None:
+        # libx264 needs even frame sizes for yuv420p, odd sizes are scaled up to the next even size
+        writer = imageio_ffmpeg.write_frames(
+            filename, (w, h), fps=fps, codec="libx264", macro_block_size=2
+        )
+        try:
+            writer.send(None)  # start the ffmpeg process
+            for frame in frames:
+                writer.send(frame)
+        finally:
+            writer.close()
+        return
+
     import cv2
 
-    h, w, _ = images[0].shape
+    # change from RGB to BGR, as OpenCV expects BGR, with a single copy of all the frames
+    frames = np.ascontiguousarray(frames[..., ::-1])
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     out = cv2.VideoWriter(filename, fourcc, fps, (w, h))
 
-    for image in images:
-        # change from RGB to BGR, as OpenCV expects BGR
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-        out.write(image)
+    for frame in frames:
+        out.write(frame)
 
     out.release()
 
@@ -149,8 +221,11 @@ def numpy_image_to_gif(
     images: List[A],
     filename: str = "output.gif",
     domain: Optional[Tuple[float, float]] = None,
+    fps: int = 10,
 ):
-    """Saves a list of images as a GIF.
+    """Saves a list of images as a GIF, or as an animated WebP if `filename` ends with .webp.
+
+    Animated WebPs are much smaller than GIFs as they are not limited to a 256 colour palette, which also makes them faster to encode since the frames do not need to be quantized.
 
     Parameters
     ----------
@@ -158,17 +233,19 @@ def numpy_image_to_gif(
         The list of images to save.
     filename : str, optional
         The path to save the GIF, by default 'output.gif'.
+    fps : int, optional
+        The frames per second of the animation, by default 10.
     """
     import PIL.Image
 
-    images = [normalize_array(image, domain=domain) for image in images]
+    images = _normalize_arrays(images, domain=domain)
 
     images = [PIL.Image.fromarray(image) for image in images]
     images[0].save(
         filename,
         save_all=True,
         append_images=images[1:],
-        duration=100,
+        duration=round(1000 / fps),
         loop=0,
     )
 
@@ -177,7 +254,7 @@ def save_images(
     images: List[A],
     save_path: str,
     domain: Optional[Tuple[float, float]] = None,
-    fps: int = 5,
+    fps: Optional[int] = None,
 ) -> str:
     """Save a list of images as numpy arrays or PNG files.
 
@@ -186,20 +263,21 @@ def save_images(
     images : List[np.ndarray]
         The list of images to save.
     save_path : str
-        The path to save the images. The supported file formats are .npy, .png, .mp4 and .gif.
+        The path to save the images. The supported file formats are .npy, .png, .mp4, .gif and .webp.
 
         - 'npy': Save the images as a single numpy array.
         - 'png': Save the images as individual PNG files. If a single image is provided, the name will be the same as the path. If multiple images are provided, the name will be the path with an index appended. (e.g. 'path_0.png', 'path_1.png', etc.)
         - 'mp4': Save the images as an MP4 video. The path should include the file extension.
         - 'gif': Save the images as a GIF. The path should include the file extension.
+        - 'webp': Save the images as an animated WebP. The path should include the file extension.
 
     domain : Tuple[float, float], optional
         The domain of the input array, by default None. If None, the domain will be inferred from the array.
-    fps : int, optional
-        The frames per second of the video, by default 5. Only used a video is saved.
+    fps : Optional[int], optional
+        The frames per second of the video or animation, by default None which uses 5 for MP4s and 10 (100 ms per frame) for GIFs and WebPs. Only used when an MP4, GIF or WebP is saved.
     """
     save_type = save_path.split(".")[-1]
-    images = [normalize_array(image, domain) for image in images]
+    images = _normalize_arrays(images, domain=domain)
     if save_type == "npy":
         images_array = np.stack(images)
         np.save(save_path, images_array)
@@ -215,12 +293,12 @@ def save_images(
                 image = PIL.Image.fromarray(image)
                 image.save(f"{save_path}_{i}.png")
     elif save_type == "mp4":
-        numpy_image_to_video(images, filename=save_path, fps=fps)
-    elif save_type == "gif":
-        numpy_image_to_gif(images, filename=save_path)
+        numpy_image_to_video(images, filename=save_path, fps=fps or 5)
+    elif save_type in ("gif", "webp"):
+        numpy_image_to_gif(images, filename=save_path, fps=fps or 10)
     else:
         raise ValueError(
-            f"Unsupported save type: {save_type}. Only 'npy', 'png', 'mp4' and 'gif' are supported."
+            f"Unsupported save type: {save_type}. Only 'npy', 'png', 'mp4', 'gif' and 'webp' are supported."
         )
 
 
@@ -249,18 +327,23 @@ def load_gif(gif_path: str) -> List[A]:
 def load_images(
     image_paths: Union[str, List[str]],
     return_as_numpy: bool = False,
-) -> List[A]:
+    return_as_tensor: bool = False,
+) -> Union[List[A], A, T]:
     """Load a list of images from file paths.
 
     Parameters
     ----------
     image_paths :  Union[str, List[str]],
         The path(s) to the images to load. The supported file formats are .npy, .png and .gif.
+    return_as_numpy : bool, optional
+        Whether to stack the images into a single NumPy array, by default False.
+    return_as_tensor : bool, optional
+        Whether to stack the images into a single tensor of shape (N, C, H, W), by default False. The PNG files are then decoded by `torchvision.io.read_image` straight into tensors.
 
     Returns
     -------
-    List[np.ndarray]
-        The list of images.
+    Union[List[np.ndarray], np.ndarray, torch.Tensor]
+        The list of images, or the stacked images if `return_as_numpy` or `return_as_tensor` is True.
     """
     if isinstance(image_paths, str):
         image_paths = [image_paths]
@@ -276,6 +359,11 @@ def load_images(
                 images_ = [images_]
             images.extend(images_)
         elif path.endswith(".png"):
+            if return_as_tensor:
+                from torchvision.io import read_image
+
+                images.append(read_image(path))
+                continue
             image = PIL.Image.open(path)
             image: A = np.array(image)
             images.append(image)
@@ -286,6 +374,16 @@ def load_images(
             raise ValueError(
                 f"Unsupported file format: {path}. Only .npy, .png and .gif files are supported."
             )
+    if return_as_tensor:
+        images = [
+            (
+                image
+                if isinstance(image, T)
+                else torch.from_numpy(np.atleast_3d(image)).permute(2, 0, 1)
+            )
+            for image in images
+        ]
+        return torch.stack(images)
     if return_as_numpy:
         images = np.stack(images)
     return images
@@ -351,11 +449,7 @@ def array_to_jsbuffer(array: A) -> str:
     data_base64 = base64.b64encode(array.tobytes()).decode("ascii")
     code = """
         (function() {
-            const data = atob("%s");
-            const buf = new Uint8Array(data.length);
-            for (var i=0; i<data.length; ++i) {
-                buf[i] = data.charCodeAt(i);
-            }
+            const buf = Uint8Array.from(atob("%s"), c => c.charCodeAt(0));
             var array_type = %s;
             if (array_type == Uint8Array) {
                 return buf;
@@ -370,9 +464,20 @@ def array_to_jsbuffer(array: A) -> str:
 
 
 def _display_html(html_str):
+    import IPython.display
+
     IPython.display.display(IPython.display.HTML(html_str))
 
 
+# the data URLs of the last displayed images, keyed by their content, so re-rendering the same images with e.g. new labels or width does not encode them again
+IMAGE_URL_CACHE_SIZE = 128
+# the total size of the cached data URLs in characters, larger URLs such as long `animate_sequence` strips are not cached
+IMAGE_URL_CACHE_BYTES = 32 * 1024 * 1024
+_image_url_cache = OrderedDict()
+# running total of the lengths of the cached URLs, kept in sync on every insert and eviction
+_image_url_cache_bytes = 0
+
+
 def _image_url(
     array: A,
     fmt: str = "png",
@@ -400,14 +505,38 @@ def _image_url(
     str
         The URL of the image.
     """
+    global _image_url_cache_bytes
     supported_modes = "data"
     if mode not in supported_modes:
         message = "Unsupported mode '%s', should be one of '%s'."
         raise ValueError(message, mode, supported_modes)
 
+    array = np.ascontiguousarray(array)
+    key = (
+        hashlib.blake2b(array).hexdigest(),
+        array.shape,
+        array.dtype.str,
+        fmt,
+        quality,
+        None if domain is None else tuple(domain),
+    )
+    if key in _image_url_cache:
+        _image_url_cache.move_to_end(key)
+        return _image_url_cache[key]
+
     image_data = serialize_array(array, fmt=fmt, quality=quality, domain=domain)
     base64_byte_string = base64.b64encode(image_data).decode("ascii")
-    return "data:image/" + fmt.upper() + ";base64," + base64_byte_string
+    url = "data:image/" + fmt.upper() + ";base64," + base64_byte_string
+    if len(url) > IMAGE_URL_CACHE_BYTES:
+        return url
+    _image_url_cache[key] = url
+    _image_url_cache_bytes += len(url)
+    while (
+        len(_image_url_cache) > IMAGE_URL_CACHE_SIZE
+        or _image_url_cache_bytes > IMAGE_URL_CACHE_BYTES
+    ):
+        _image_url_cache_bytes -= len(_image_url_cache.popitem(last=False)[1])
+    return url
 
 
 def _image_html(
@@ -647,15 +776,16 @@ def load_image(
 
         image = image.resize((w, h))
 
-    image = np.array(image)
-    image = image / 255.0
+    # scale straight into a float32 array instead of going through float64
+    image = np.multiply(np.asarray(image), np.float32(1 / 255.0), dtype=np.float32)
     if not return_as_tensor:
         return image
 
-    image = (
-        torch.tensor(np.transpose(image, [2, 0, 1]))
-        .unsqueeze(0)  # batch dimension
-        .float()
-        .to(device)
-    )
-    return image
+    image = torch.from_numpy(image).permute(2, 0, 1).unsqueeze(0)  # batch dimension
+    if torch.device(device).type != "cuda":
+        return image.contiguous().to(device)
+
+    # copy into page-locked memory so that the transfer to the GPU is asynchronous
+    pinned = torch.empty(image.shape, dtype=image.dtype, pin_memory=True)
+    pinned.copy_(image)
+    return pinned.to(device, non_blocking=True)
@@ -2,35 +2,35 @@
 https://github.com/greentfrapp/lucent/blob/dev/lucent/modelzoo/inceptionv1/InceptionV1.py
 """
 
+import os
 import torch
+import torch.fx
 import torch.nn as nn
 import torch.nn.functional as F
+from contextlib import nullcontext
+from functools import partial
+from typing import Optional
+from urllib.parse import urlparse
 
 
-class AdditionLayer(nn.Module):
-    def forward(self, t_1, t_2):
-        return t_1 + t_2
+def _local_response_norm(tensor, size=5, alpha=1e-4, beta=0.75, k=1.0):
+    """Same as `F.local_response_norm` for 4D inputs and odd `size`, but with fewer passes over the activation.
 
-
-class MaxPool2dLayer(nn.Module):
-    def forward(
-        self, tensor, kernel_size=(3, 3), stride=(1, 1), padding=0, ceil_mode=False
-    ):
-        return F.max_pool2d(
-            tensor, kernel_size, stride=stride, padding=padding, ceil_mode=ceil_mode
-        )
-
-
-class PadLayer(nn.Module):
-    def forward(self, tensor, padding=(1, 1, 1, 1), value=None):
-        if value is None:
-            return F.pad(tensor, padding)
-        return F.pad(tensor, padding, value=value)
-
-
-class ReluLayer(nn.Module):
-    def forward(self, tensor):
-        return F.relu(tensor)
+    The channel padding is done by the average pool itself instead of a separate `F.pad`, the scaling is done in place and `beta=0.5` uses `rsqrt` instead of `pow` and a division. The squares are summed in at least float32 so they can not overflow in float16, and the result is cast back to the input dtype.
+    """
+    # only upcast the low precision dtypes, float64 inputs keep their precision
+    squared = (
+        tensor.to(torch.promote_types(tensor.dtype, torch.float32))
+        .square()
+        .unsqueeze(1)
+    )
+    div = F.avg_pool3d(
+        squared, (size, 1, 1), stride=1, padding=(size // 2, 0, 0)
+    ).squeeze(1)
+    div = div.mul_(alpha).add_(k)
+    if beta == 0.5:
+        return tensor * div.rsqrt().to(tensor.dtype)
+    return tensor / div.pow(beta).to(tensor.dtype)
 
 
 class RedirectedReLU(torch.autograd.Function):
@@ -43,15 +43,20 @@ class RedirectedReLU(torch.autograd.Function):
 
     @staticmethod
     def forward(ctx, input_tensor):
-        ctx.save_for_backward(input_tensor)
+        # the backward only needs the sign of the input, so keep a bool mask instead of the whole tensor
+        ctx.save_for_backward(input_tensor < 0)
         return input_tensor.clamp(min=0)
 
     @staticmethod
     def backward(ctx, grad_output):
-        (input_tensor,) = ctx.saved_tensors
-        grad_input = grad_output.clone()
-        grad_input[input_tensor < 0] = grad_input[input_tensor < 0] * 1e-1
-        return grad_input
+        (negative_mask,) = ctx.saved_tensors
+        # scale the gradient of the negative inputs without a masked scatter
+        return torch.where(negative_mask, grad_output * 1e-1, grad_output)
+
+    @staticmethod
+    def symbolic(g, input_tensor):
+        # the forward pass is a plain ReLU, only the gradient is redirected
+        return g.op("Relu", input_tensor)
 
 
 class RedirectedReluLayer(nn.Module):
@@ -59,45 +64,50 @@ class RedirectedReluLayer(nn.Module):
         return RedirectedReLU.apply(tensor)
 
 
-class SoftMaxLayer(nn.Module):
-    def forward(self, tensor, dim=1):
-        return F.softmax(tensor, dim=dim)
+class ConvReLU2d(nn.Conv2d):
+    """A `nn.Conv2d` followed by an in-place ReLU, used to fuse the `*_pre_relu_conv` and ReLU pairs of the model.
 
+    The bias is kept in the convolution: moving it into a separate `add_` would only replace the bias pass of the convolution with another pointwise kernel in eager mode, while `torch.compile` (see `InceptionV1.compile_`) already folds the bias and the ReLU into the convolution epilogue.
+    """
 
-class DropoutLayer(nn.Module):
-    def forward(self, tensor, p=0.4000000059604645, training=False, inplace=True):
-        return F.dropout(input=tensor, p=p, training=training, inplace=inplace)
+    def forward(self, tensor):
+        return F.relu(super().forward(tensor), inplace=True)
 
 
 class CatLayer(nn.Module):
-    def forward(self, tensor_list, dim=1):
-        return torch.cat(tensor_list, dim)
+    def forward(self, *tensor_list, dim=1):
+        if dim != 1:
+            return torch.cat(tensor_list, dim)
+        # a no-op when all the branches are channels_last, otherwise keeps the next convs from falling back to NCHW
+        return torch.cat(tensor_list, dim).contiguous(memory_format=torch.channels_last)
 
 
-class LocalResponseNormLayer(nn.Module):
-    def forward(self, tensor, size=5, alpha=9.999999747378752e-05, beta=0.75, k=1.0):
-        return F.local_response_norm(tensor, size=size, alpha=alpha, beta=beta, k=k)
+class _LayerTracer(torch.fx.Tracer):
+    """Traces `InceptionV1._forward` keeping every layer as a single call, so the forward hooks of the layers are still called."""
 
+    traced_func_name = "_forward"
+
+    def is_leaf_module(self, module, module_qualified_name):
+        return True
 
-class AVGPoolLayer(nn.Module):
-    def forward(
-        self,
-        tensor,
-        kernel_size=(7, 7),
-        stride=(1, 1),
-        padding=(0,),
-        ceil_mode=False,
-        count_include_pad=False,
-    ):
-        return F.avg_pool2d(
-            tensor,
-            kernel_size=kernel_size,
-            stride=stride,
-            padding=padding,
-            ceil_mode=ceil_mode,
-            count_include_pad=count_include_pad,
-        )
 
+# the mixed blocks and the branches of each block that are applied directly to the block input
+MIXED_BLOCKS = (
+    "mixed3a",
+    "mixed3b",
+    "mixed4a",
+    "mixed4b",
+    "mixed4c",
+    "mixed4d",
+    "mixed4e",
+    "mixed5a",
+    "mixed5b",
+)
+REDUCE_BRANCHES = ("1x1", "3x3_bottleneck", "5x5_bottleneck")
+# the branches concatenated into the output of each mixed block
+CAT_BRANCHES = ("1x1", "3x3", "5x5", "pool_reduce")
+# the stride 2 max pools that follow some of the mixed blocks
+BLOCK_MAXPOOLS = {"mixed3b": "maxpool4", "mixed4e": "maxpool10"}
 
 model_urls = {
     # InceptionV1 model used in Lucid examples, converted by ProGamerGov
@@ -105,15 +115,69 @@ model_urls = {
 }
 
 
+def load_pretrained_state_dict(progress: bool = True) -> dict:
+    """Downloads the pretrained InceptionV1 weights if needed and loads them memory-mapped.
+
+    The weights are cached in the same place as `torch.hub.load_state_dict_from_url`. Memory-mapping pages each tensor in as it is copied into the model instead of first reading the whole file into memory.
+
+    Parameters
+    ----------
+    progress : bool, optional
+        Whether to show a progress bar while downloading the weights, by default True.
+
+    Returns
+    -------
+    dict
+        The state dict of the pretrained model.
+    """
+    url = model_urls["inceptionv1"]
+    checkpoint_dir = os.path.join(torch.hub.get_dir(), "checkpoints")
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, os.path.basename(urlparse(url).path))
+    if not os.path.exists(path):
+        torch.hub.download_url_to_file(url, path, progress=progress)
+
+    try:
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except RuntimeError:
+        # files saved with the legacy (non zip) serialization can not be memory-mapped
+        return torch.load(path, map_location="cpu", weights_only=True)
+
+
 class InceptionV1(nn.Module):
+    """The InceptionV1 (GoogLeNet) model used in the Lucid examples.
+
+    Parameters
+    ----------
+    pretrained : bool, optional
+        Whether to load the pretrained weights, by default True.
+    progress : bool, optional
+        Whether to show a progress bar while downloading the weights, by default True.
+    redirected_ReLU : bool, optional
+        Whether to use `RedirectedReLU` instead of a plain ReLU, by default True. This lets the gradient flow through the ReLUs for negative inputs, which helps the optimization to start from a random image.
+    cudnn_benchmark : bool, optional
+        Whether to enable the cuDNN autotuner, by default False. The autotuner picks the fastest algorithm for every convolution on the first forward pass and caches it, so the input shape (including the batch size) should stay the same between calls, as is the case during feature visualization. Note that this is a global PyTorch setting, so it also applies to any other model in the process.
+    autocast_dtype : Optional[torch.dtype], optional
+        The dtype to run the forward pass in using `torch.autocast`, by default None which does not enter autocast, so an autocast context opened by the caller still applies. Use `torch.float16` or `torch.bfloat16` to use the Tensor Cores on recent GPUs. The weights are kept in float32 and cast by autocast. To also halve the weight memory, the model can instead be converted with e.g. `model.bfloat16()`, the input is then cast to the dtype of the weights.
+    allow_tf32 : bool, optional
+        Whether to run float32 matmuls in TF32 on Ampere and newer GPUs, by default False. This sets `torch.set_float32_matmul_precision("high")`, which is a global PyTorch setting, so it also lowers the matmul precision of any other code in the process.
+    """
 
     def __init__(
         self,
         pretrained: bool = True,
         progress: bool = True,
         redirected_ReLU: bool = True,
+        cudnn_benchmark: bool = False,
+        autocast_dtype: Optional[torch.dtype] = None,
+        allow_tf32: bool = False,
     ) -> None:
         super(InceptionV1, self).__init__()
+        if cudnn_benchmark:
+            torch.backends.cudnn.benchmark = True
+        if allow_tf32:
+            torch.set_float32_matmul_precision("high")
+
         self.conv2d0_pre_relu_conv = nn.Conv2d(
             in_channels=3,
             out_channels=64,
@@ -135,6 +199,7 @@ class InceptionV1(nn.Module):
             out_channels=192,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -175,6 +240,7 @@ class InceptionV1(nn.Module):
             out_channels=128,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -183,6 +249,7 @@ class InceptionV1(nn.Module):
             out_channels=32,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -223,6 +290,7 @@ class InceptionV1(nn.Module):
             out_channels=192,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -231,6 +299,7 @@ class InceptionV1(nn.Module):
             out_channels=96,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -271,6 +340,7 @@ class InceptionV1(nn.Module):
             out_channels=204,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -279,6 +349,7 @@ class InceptionV1(nn.Module):
             out_channels=48,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -319,6 +390,7 @@ class InceptionV1(nn.Module):
             out_channels=224,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -327,6 +399,7 @@ class InceptionV1(nn.Module):
             out_channels=64,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -367,6 +440,7 @@ class InceptionV1(nn.Module):
             out_channels=256,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -375,6 +449,7 @@ class InceptionV1(nn.Module):
             out_channels=64,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -415,6 +490,7 @@ class InceptionV1(nn.Module):
             out_channels=288,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -423,6 +499,7 @@ class InceptionV1(nn.Module):
             out_channels=64,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -463,6 +540,7 @@ class InceptionV1(nn.Module):
             out_channels=320,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -471,6 +549,7 @@ class InceptionV1(nn.Module):
             out_channels=128,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -511,6 +590,7 @@ class InceptionV1(nn.Module):
             out_channels=320,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -519,6 +599,7 @@ class InceptionV1(nn.Module):
             out_channels=128,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -559,6 +640,7 @@ class InceptionV1(nn.Module):
             out_channels=384,
             kernel_size=(3, 3),
             stride=(1, 1),
+            padding=(1, 1),
             groups=1,
             bias=True,
         )
@@ -567,6 +649,7 @@ class InceptionV1(nn.Module):
             out_channels=128,
             kernel_size=(5, 5),
             stride=(1, 1),
+            padding=(2, 2),
             groups=1,
             bias=True,
         )
@@ -574,26 +657,36 @@ class InceptionV1(nn.Module):
             in_features=1024, out_features=1008, bias=True
         )
 
+        self.redirected_ReLU = redirected_ReLU
+        self.autocast_dtype = autocast_dtype
+        # output channels of the branches of the mixed blocks fused by `fuse_branches`
+        self._fused_branches = {}
         self.add_layers(redirected_ReLU)
+        self.graph = self.build_graph()
+
+        # store the conv weights as NHWC so cuDNN can use its native channels_last kernels
+        self.to(memory_format=torch.channels_last)
 
         if pretrained:
-            self.load_state_dict(
-                torch.hub.load_state_dict_from_url(
-                    model_urls["inceptionv1"], progress=progress
-                )
-            )
+            # copying keeps the NHWC layout of the parameters, the memory-mapped tensors are paged in one at a time
+            self.load_state_dict(load_pretrained_state_dict(progress=progress))
 
     def add_layers(self, redirected_ReLU=True):
         if redirected_ReLU:
             relu = RedirectedReluLayer
         else:
-            relu = ReluLayer
+            relu = nn.ReLU
+        # The ReLUs, pools and concatenations are stateless, but each layer needs its own
+        # instance: objectives attach forward hooks to the layers by name, and a module
+        # shared between layers would call its hooks for every one of them.
         self.conv2d0 = relu()
-        self.maxpool0 = MaxPool2dLayer()
+        self.maxpool0 = nn.MaxPool2d(kernel_size=(3, 3), stride=(2, 2), ceil_mode=True)
         self.conv2d1 = relu()
         self.conv2d2 = relu()
-        self.maxpool1 = MaxPool2dLayer()
-        self.mixed3a_pool = MaxPool2dLayer()
+        self.maxpool1 = nn.MaxPool2d(kernel_size=(3, 3), stride=(2, 2), ceil_mode=True)
+        self.mixed3a_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed3a_1x1 = relu()
         self.mixed3a_3x3_bottleneck = relu()
         self.mixed3a_5x5_bottleneck = relu()
@@ -601,7 +694,9 @@ class InceptionV1(nn.Module):
         self.mixed3a_3x3 = relu()
         self.mixed3a_5x5 = relu()
         self.mixed3a = CatLayer()
-        self.mixed3b_pool = MaxPool2dLayer()
+        self.mixed3b_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed3b_1x1 = relu()
         self.mixed3b_3x3_bottleneck = relu()
         self.mixed3b_5x5_bottleneck = relu()
@@ -609,8 +704,10 @@ class InceptionV1(nn.Module):
         self.mixed3b_3x3 = relu()
         self.mixed3b_5x5 = relu()
         self.mixed3b = CatLayer()
-        self.maxpool4 = MaxPool2dLayer()
-        self.mixed4a_pool = MaxPool2dLayer()
+        self.maxpool4 = nn.MaxPool2d(kernel_size=(3, 3), stride=(2, 2), ceil_mode=True)
+        self.mixed4a_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed4a_1x1 = relu()
         self.mixed4a_3x3_bottleneck = relu()
         self.mixed4a_5x5_bottleneck = relu()
@@ -618,7 +715,9 @@ class InceptionV1(nn.Module):
         self.mixed4a_3x3 = relu()
         self.mixed4a_5x5 = relu()
         self.mixed4a = CatLayer()
-        self.mixed4b_pool = MaxPool2dLayer()
+        self.mixed4b_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed4b_1x1 = relu()
         self.mixed4b_3x3_bottleneck = relu()
         self.mixed4b_5x5_bottleneck = relu()
@@ -626,7 +725,9 @@ class InceptionV1(nn.Module):
         self.mixed4b_3x3 = relu()
         self.mixed4b_5x5 = relu()
         self.mixed4b = CatLayer()
-        self.mixed4c_pool = MaxPool2dLayer()
+        self.mixed4c_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed4c_1x1 = relu()
         self.mixed4c_3x3_bottleneck = relu()
         self.mixed4c_5x5_bottleneck = relu()
@@ -634,7 +735,9 @@ class InceptionV1(nn.Module):
         self.mixed4c_3x3 = relu()
         self.mixed4c_5x5 = relu()
         self.mixed4c = CatLayer()
-        self.mixed4d_pool = MaxPool2dLayer()
+        self.mixed4d_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed4d_1x1 = relu()
         self.mixed4d_3x3_bottleneck = relu()
         self.mixed4d_5x5_bottleneck = relu()
@@ -642,7 +745,9 @@ class InceptionV1(nn.Module):
         self.mixed4d_3x3 = relu()
         self.mixed4d_5x5 = relu()
         self.mixed4d = CatLayer()
-        self.mixed4e_pool = MaxPool2dLayer()
+        self.mixed4e_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed4e_1x1 = relu()
         self.mixed4e_3x3_bottleneck = relu()
         self.mixed4e_5x5_bottleneck = relu()
@@ -650,8 +755,10 @@ class InceptionV1(nn.Module):
         self.mixed4e_3x3 = relu()
         self.mixed4e_5x5 = relu()
         self.mixed4e = CatLayer()
-        self.maxpool10 = MaxPool2dLayer()
-        self.mixed5a_pool = MaxPool2dLayer()
+        self.maxpool10 = nn.MaxPool2d(kernel_size=(3, 3), stride=(2, 2), ceil_mode=True)
+        self.mixed5a_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed5a_1x1 = relu()
         self.mixed5a_3x3_bottleneck = relu()
         self.mixed5a_5x5_bottleneck = relu()
@@ -659,7 +766,9 @@ class InceptionV1(nn.Module):
         self.mixed5a_3x3 = relu()
         self.mixed5a_5x5 = relu()
         self.mixed5a = CatLayer()
-        self.mixed5b_pool = MaxPool2dLayer()
+        self.mixed5b_pool = nn.MaxPool2d(
+            kernel_size=(3, 3), stride=(1, 1), padding=(1, 1)
+        )
         self.mixed5b_1x1 = relu()
         self.mixed5b_3x3_bottleneck = relu()
         self.mixed5b_5x5_bottleneck = relu()
@@ -667,419 +776,325 @@ class InceptionV1(nn.Module):
         self.mixed5b_3x3 = relu()
         self.mixed5b_5x5 = relu()
         self.mixed5b = CatLayer()
-        self.softmax2 = SoftMaxLayer()
+        self.softmax2 = nn.Softmax(dim=1)
 
-    def forward(self, x):
-        conv2d0_pre_relu_conv_pad = F.pad(x, (2, 3, 2, 3))
-        conv2d0_pre_relu_conv = self.conv2d0_pre_relu_conv(conv2d0_pre_relu_conv_pad)
-        conv2d0 = self.conv2d0(conv2d0_pre_relu_conv)
-        maxpool0_pad = F.pad(conv2d0, (0, 1, 0, 1), value=float("-inf"))
-        maxpool0 = self.maxpool0(
-            maxpool0_pad, kernel_size=(3, 3), stride=(2, 2), padding=0, ceil_mode=False
-        )
-        localresponsenorm0 = F.local_response_norm(
-            maxpool0, size=9, alpha=9.99999974738e-05, beta=0.5, k=1
-        )
-        conv2d1_pre_relu_conv = self.conv2d1_pre_relu_conv(localresponsenorm0)
-        conv2d1 = self.conv2d1(conv2d1_pre_relu_conv)
-        conv2d2_pre_relu_conv_pad = F.pad(conv2d1, (1, 1, 1, 1))
-        conv2d2_pre_relu_conv = self.conv2d2_pre_relu_conv(conv2d2_pre_relu_conv_pad)
-        conv2d2 = self.conv2d2(conv2d2_pre_relu_conv)
-        localresponsenorm1 = F.local_response_norm(
-            conv2d2, size=9, alpha=9.99999974738e-05, beta=0.5, k=1
-        )
-        maxpool1_pad = F.pad(localresponsenorm1, (0, 1, 0, 1), value=float("-inf"))
-        maxpool1 = self.maxpool1(
-            maxpool1_pad, kernel_size=(3, 3), stride=(2, 2), padding=0, ceil_mode=False
-        )
-        mixed3a_1x1_pre_relu_conv = self.mixed3a_1x1_pre_relu_conv(maxpool1)
-        mixed3a_3x3_bottleneck_pre_relu_conv = (
-            self.mixed3a_3x3_bottleneck_pre_relu_conv(maxpool1)
-        )
-        mixed3a_5x5_bottleneck_pre_relu_conv = (
-            self.mixed3a_5x5_bottleneck_pre_relu_conv(maxpool1)
-        )
-        mixed3a_pool_pad = F.pad(maxpool1, (1, 1, 1, 1), value=float("-inf"))
-        mixed3a_pool = self.mixed3a_pool(
-            mixed3a_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed3a_1x1 = self.mixed3a_1x1(mixed3a_1x1_pre_relu_conv)
-        mixed3a_3x3_bottleneck = self.mixed3a_3x3_bottleneck(
-            mixed3a_3x3_bottleneck_pre_relu_conv
-        )
-        mixed3a_5x5_bottleneck = self.mixed3a_5x5_bottleneck(
-            mixed3a_5x5_bottleneck_pre_relu_conv
-        )
-        mixed3a_pool_reduce_pre_relu_conv = self.mixed3a_pool_reduce_pre_relu_conv(
-            mixed3a_pool
-        )
-        mixed3a_3x3_pre_relu_conv_pad = F.pad(mixed3a_3x3_bottleneck, (1, 1, 1, 1))
-        mixed3a_3x3_pre_relu_conv = self.mixed3a_3x3_pre_relu_conv(
-            mixed3a_3x3_pre_relu_conv_pad
-        )
-        mixed3a_5x5_pre_relu_conv_pad = F.pad(mixed3a_5x5_bottleneck, (2, 2, 2, 2))
-        mixed3a_5x5_pre_relu_conv = self.mixed3a_5x5_pre_relu_conv(
-            mixed3a_5x5_pre_relu_conv_pad
-        )
-        mixed3a_pool_reduce = self.mixed3a_pool_reduce(
-            mixed3a_pool_reduce_pre_relu_conv
-        )
-        mixed3a_3x3 = self.mixed3a_3x3(mixed3a_3x3_pre_relu_conv)
-        mixed3a_5x5 = self.mixed3a_5x5(mixed3a_5x5_pre_relu_conv)
-        mixed3a = self.mixed3a(
-            (mixed3a_1x1, mixed3a_3x3, mixed3a_5x5, mixed3a_pool_reduce), 1
-        )
-        mixed3b_1x1_pre_relu_conv = self.mixed3b_1x1_pre_relu_conv(mixed3a)
-        mixed3b_3x3_bottleneck_pre_relu_conv = (
-            self.mixed3b_3x3_bottleneck_pre_relu_conv(mixed3a)
-        )
-        mixed3b_5x5_bottleneck_pre_relu_conv = (
-            self.mixed3b_5x5_bottleneck_pre_relu_conv(mixed3a)
-        )
-        mixed3b_pool_pad = F.pad(mixed3a, (1, 1, 1, 1), value=float("-inf"))
-        mixed3b_pool = self.mixed3b_pool(
-            mixed3b_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed3b_1x1 = self.mixed3b_1x1(mixed3b_1x1_pre_relu_conv)
-        mixed3b_3x3_bottleneck = self.mixed3b_3x3_bottleneck(
-            mixed3b_3x3_bottleneck_pre_relu_conv
-        )
-        mixed3b_5x5_bottleneck = self.mixed3b_5x5_bottleneck(
-            mixed3b_5x5_bottleneck_pre_relu_conv
-        )
-        mixed3b_pool_reduce_pre_relu_conv = self.mixed3b_pool_reduce_pre_relu_conv(
-            mixed3b_pool
-        )
-        mixed3b_3x3_pre_relu_conv_pad = F.pad(mixed3b_3x3_bottleneck, (1, 1, 1, 1))
-        mixed3b_3x3_pre_relu_conv = self.mixed3b_3x3_pre_relu_conv(
-            mixed3b_3x3_pre_relu_conv_pad
-        )
-        mixed3b_5x5_pre_relu_conv_pad = F.pad(mixed3b_5x5_bottleneck, (2, 2, 2, 2))
-        mixed3b_5x5_pre_relu_conv = self.mixed3b_5x5_pre_relu_conv(
-            mixed3b_5x5_pre_relu_conv_pad
-        )
-        mixed3b_pool_reduce = self.mixed3b_pool_reduce(
-            mixed3b_pool_reduce_pre_relu_conv
-        )
-        mixed3b_3x3 = self.mixed3b_3x3(mixed3b_3x3_pre_relu_conv)
-        mixed3b_5x5 = self.mixed3b_5x5(mixed3b_5x5_pre_relu_conv)
-        mixed3b = self.mixed3b(
-            (mixed3b_1x1, mixed3b_3x3, mixed3b_5x5, mixed3b_pool_reduce), 1
-        )
-        maxpool4_pad = F.pad(mixed3b, (0, 1, 0, 1), value=float("-inf"))
-        maxpool4 = self.maxpool4(
-            maxpool4_pad, kernel_size=(3, 3), stride=(2, 2), padding=0, ceil_mode=False
-        )
-        mixed4a_1x1_pre_relu_conv = self.mixed4a_1x1_pre_relu_conv(maxpool4)
-        mixed4a_3x3_bottleneck_pre_relu_conv = (
-            self.mixed4a_3x3_bottleneck_pre_relu_conv(maxpool4)
-        )
-        mixed4a_5x5_bottleneck_pre_relu_conv = (
-            self.mixed4a_5x5_bottleneck_pre_relu_conv(maxpool4)
-        )
-        mixed4a_pool_pad = F.pad(maxpool4, (1, 1, 1, 1), value=float("-inf"))
-        mixed4a_pool = self.mixed4a_pool(
-            mixed4a_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed4a_1x1 = self.mixed4a_1x1(mixed4a_1x1_pre_relu_conv)
-        mixed4a_3x3_bottleneck = self.mixed4a_3x3_bottleneck(
-            mixed4a_3x3_bottleneck_pre_relu_conv
-        )
-        mixed4a_5x5_bottleneck = self.mixed4a_5x5_bottleneck(
-            mixed4a_5x5_bottleneck_pre_relu_conv
-        )
-        mixed4a_pool_reduce_pre_relu_conv = self.mixed4a_pool_reduce_pre_relu_conv(
-            mixed4a_pool
-        )
-        mixed4a_3x3_pre_relu_conv_pad = F.pad(mixed4a_3x3_bottleneck, (1, 1, 1, 1))
-        mixed4a_3x3_pre_relu_conv = self.mixed4a_3x3_pre_relu_conv(
-            mixed4a_3x3_pre_relu_conv_pad
-        )
-        mixed4a_5x5_pre_relu_conv_pad = F.pad(mixed4a_5x5_bottleneck, (2, 2, 2, 2))
-        mixed4a_5x5_pre_relu_conv = self.mixed4a_5x5_pre_relu_conv(
-            mixed4a_5x5_pre_relu_conv_pad
-        )
-        mixed4a_pool_reduce = self.mixed4a_pool_reduce(
-            mixed4a_pool_reduce_pre_relu_conv
-        )
-        mixed4a_3x3 = self.mixed4a_3x3(mixed4a_3x3_pre_relu_conv)
-        mixed4a_5x5 = self.mixed4a_5x5(mixed4a_5x5_pre_relu_conv)
-        mixed4a = self.mixed4a(
-            (mixed4a_1x1, mixed4a_3x3, mixed4a_5x5, mixed4a_pool_reduce), 1
-        )
-        mixed4b_1x1_pre_relu_conv = self.mixed4b_1x1_pre_relu_conv(mixed4a)
-        mixed4b_3x3_bottleneck_pre_relu_conv = (
-            self.mixed4b_3x3_bottleneck_pre_relu_conv(mixed4a)
-        )
-        mixed4b_5x5_bottleneck_pre_relu_conv = (
-            self.mixed4b_5x5_bottleneck_pre_relu_conv(mixed4a)
-        )
-        mixed4b_pool_pad = F.pad(mixed4a, (1, 1, 1, 1), value=float("-inf"))
-        mixed4b_pool = self.mixed4b_pool(
-            mixed4b_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed4b_1x1 = self.mixed4b_1x1(mixed4b_1x1_pre_relu_conv)
-        mixed4b_3x3_bottleneck = self.mixed4b_3x3_bottleneck(
-            mixed4b_3x3_bottleneck_pre_relu_conv
-        )
-        mixed4b_5x5_bottleneck = self.mixed4b_5x5_bottleneck(
-            mixed4b_5x5_bottleneck_pre_relu_conv
-        )
-        mixed4b_pool_reduce_pre_relu_conv = self.mixed4b_pool_reduce_pre_relu_conv(
-            mixed4b_pool
-        )
-        mixed4b_3x3_pre_relu_conv_pad = F.pad(mixed4b_3x3_bottleneck, (1, 1, 1, 1))
-        mixed4b_3x3_pre_relu_conv = self.mixed4b_3x3_pre_relu_conv(
-            mixed4b_3x3_pre_relu_conv_pad
-        )
-        mixed4b_5x5_pre_relu_conv_pad = F.pad(mixed4b_5x5_bottleneck, (2, 2, 2, 2))
-        mixed4b_5x5_pre_relu_conv = self.mixed4b_5x5_pre_relu_conv(
-            mixed4b_5x5_pre_relu_conv_pad
-        )
-        mixed4b_pool_reduce = self.mixed4b_pool_reduce(
-            mixed4b_pool_reduce_pre_relu_conv
-        )
-        mixed4b_3x3 = self.mixed4b_3x3(mixed4b_3x3_pre_relu_conv)
-        mixed4b_5x5 = self.mixed4b_5x5(mixed4b_5x5_pre_relu_conv)
-        mixed4b = self.mixed4b(
-            (mixed4b_1x1, mixed4b_3x3, mixed4b_5x5, mixed4b_pool_reduce), 1
-        )
-        mixed4c_1x1_pre_relu_conv = self.mixed4c_1x1_pre_relu_conv(mixed4b)
-        mixed4c_3x3_bottleneck_pre_relu_conv = (
-            self.mixed4c_3x3_bottleneck_pre_relu_conv(mixed4b)
-        )
-        mixed4c_5x5_bottleneck_pre_relu_conv = (
-            self.mixed4c_5x5_bottleneck_pre_relu_conv(mixed4b)
-        )
-        mixed4c_pool_pad = F.pad(mixed4b, (1, 1, 1, 1), value=float("-inf"))
-        mixed4c_pool = self.mixed4c_pool(
-            mixed4c_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed4c_1x1 = self.mixed4c_1x1(mixed4c_1x1_pre_relu_conv)
-        mixed4c_3x3_bottleneck = self.mixed4c_3x3_bottleneck(
-            mixed4c_3x3_bottleneck_pre_relu_conv
-        )
-        mixed4c_5x5_bottleneck = self.mixed4c_5x5_bottleneck(
-            mixed4c_5x5_bottleneck_pre_relu_conv
-        )
-        mixed4c_pool_reduce_pre_relu_conv = self.mixed4c_pool_reduce_pre_relu_conv(
-            mixed4c_pool
-        )
-        mixed4c_3x3_pre_relu_conv_pad = F.pad(mixed4c_3x3_bottleneck, (1, 1, 1, 1))
-        mixed4c_3x3_pre_relu_conv = self.mixed4c_3x3_pre_relu_conv(
-            mixed4c_3x3_pre_relu_conv_pad
-        )
-        mixed4c_5x5_pre_relu_conv_pad = F.pad(mixed4c_5x5_bottleneck, (2, 2, 2, 2))
-        mixed4c_5x5_pre_relu_conv = self.mixed4c_5x5_pre_relu_conv(
-            mixed4c_5x5_pre_relu_conv_pad
-        )
-        mixed4c_pool_reduce = self.mixed4c_pool_reduce(
-            mixed4c_pool_reduce_pre_relu_conv
-        )
-        mixed4c_3x3 = self.mixed4c_3x3(mixed4c_3x3_pre_relu_conv)
-        mixed4c_5x5 = self.mixed4c_5x5(mixed4c_5x5_pre_relu_conv)
-        mixed4c = self.mixed4c(
-            (mixed4c_1x1, mixed4c_3x3, mixed4c_5x5, mixed4c_pool_reduce), 1
-        )
-        mixed4d_1x1_pre_relu_conv = self.mixed4d_1x1_pre_relu_conv(mixed4c)
-        mixed4d_3x3_bottleneck_pre_relu_conv = (
-            self.mixed4d_3x3_bottleneck_pre_relu_conv(mixed4c)
-        )
-        mixed4d_5x5_bottleneck_pre_relu_conv = (
-            self.mixed4d_5x5_bottleneck_pre_relu_conv(mixed4c)
-        )
-        mixed4d_pool_pad = F.pad(mixed4c, (1, 1, 1, 1), value=float("-inf"))
-        mixed4d_pool = self.mixed4d_pool(
-            mixed4d_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed4d_1x1 = self.mixed4d_1x1(mixed4d_1x1_pre_relu_conv)
-        mixed4d_3x3_bottleneck = self.mixed4d_3x3_bottleneck(
-            mixed4d_3x3_bottleneck_pre_relu_conv
-        )
-        mixed4d_5x5_bottleneck = self.mixed4d_5x5_bottleneck(
-            mixed4d_5x5_bottleneck_pre_relu_conv
-        )
-        mixed4d_pool_reduce_pre_relu_conv = self.mixed4d_pool_reduce_pre_relu_conv(
-            mixed4d_pool
-        )
-        mixed4d_3x3_pre_relu_conv_pad = F.pad(mixed4d_3x3_bottleneck, (1, 1, 1, 1))
-        mixed4d_3x3_pre_relu_conv = self.mixed4d_3x3_pre_relu_conv(
-            mixed4d_3x3_pre_relu_conv_pad
-        )
-        mixed4d_5x5_pre_relu_conv_pad = F.pad(mixed4d_5x5_bottleneck, (2, 2, 2, 2))
-        mixed4d_5x5_pre_relu_conv = self.mixed4d_5x5_pre_relu_conv(
-            mixed4d_5x5_pre_relu_conv_pad
-        )
-        mixed4d_pool_reduce = self.mixed4d_pool_reduce(
-            mixed4d_pool_reduce_pre_relu_conv
-        )
-        mixed4d_3x3 = self.mixed4d_3x3(mixed4d_3x3_pre_relu_conv)
-        mixed4d_5x5 = self.mixed4d_5x5(mixed4d_5x5_pre_relu_conv)
-        mixed4d = self.mixed4d(
-            (mixed4d_1x1, mixed4d_3x3, mixed4d_5x5, mixed4d_pool_reduce), 1
-        )
-        mixed4e_1x1_pre_relu_conv = self.mixed4e_1x1_pre_relu_conv(mixed4d)
-        mixed4e_3x3_bottleneck_pre_relu_conv = (
-            self.mixed4e_3x3_bottleneck_pre_relu_conv(mixed4d)
-        )
-        mixed4e_5x5_bottleneck_pre_relu_conv = (
-            self.mixed4e_5x5_bottleneck_pre_relu_conv(mixed4d)
-        )
-        mixed4e_pool_pad = F.pad(mixed4d, (1, 1, 1, 1), value=float("-inf"))
-        mixed4e_pool = self.mixed4e_pool(
-            mixed4e_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed4e_1x1 = self.mixed4e_1x1(mixed4e_1x1_pre_relu_conv)
-        mixed4e_3x3_bottleneck = self.mixed4e_3x3_bottleneck(
-            mixed4e_3x3_bottleneck_pre_relu_conv
-        )
-        mixed4e_5x5_bottleneck = self.mixed4e_5x5_bottleneck(
-            mixed4e_5x5_bottleneck_pre_relu_conv
-        )
-        mixed4e_pool_reduce_pre_relu_conv = self.mixed4e_pool_reduce_pre_relu_conv(
-            mixed4e_pool
-        )
-        mixed4e_3x3_pre_relu_conv_pad = F.pad(mixed4e_3x3_bottleneck, (1, 1, 1, 1))
-        mixed4e_3x3_pre_relu_conv = self.mixed4e_3x3_pre_relu_conv(
-            mixed4e_3x3_pre_relu_conv_pad
-        )
-        mixed4e_5x5_pre_relu_conv_pad = F.pad(mixed4e_5x5_bottleneck, (2, 2, 2, 2))
-        mixed4e_5x5_pre_relu_conv = self.mixed4e_5x5_pre_relu_conv(
-            mixed4e_5x5_pre_relu_conv_pad
-        )
-        mixed4e_pool_reduce = self.mixed4e_pool_reduce(
-            mixed4e_pool_reduce_pre_relu_conv
-        )
-        mixed4e_3x3 = self.mixed4e_3x3(mixed4e_3x3_pre_relu_conv)
-        mixed4e_5x5 = self.mixed4e_5x5(mixed4e_5x5_pre_relu_conv)
-        mixed4e = self.mixed4e(
-            (mixed4e_1x1, mixed4e_3x3, mixed4e_5x5, mixed4e_pool_reduce), 1
-        )
-        maxpool10_pad = F.pad(mixed4e, (0, 1, 0, 1), value=float("-inf"))
-        maxpool10 = self.maxpool10(
-            maxpool10_pad, kernel_size=(3, 3), stride=(2, 2), padding=0, ceil_mode=False
-        )
-        mixed5a_1x1_pre_relu_conv = self.mixed5a_1x1_pre_relu_conv(maxpool10)
-        mixed5a_3x3_bottleneck_pre_relu_conv = (
-            self.mixed5a_3x3_bottleneck_pre_relu_conv(maxpool10)
-        )
-        mixed5a_5x5_bottleneck_pre_relu_conv = (
-            self.mixed5a_5x5_bottleneck_pre_relu_conv(maxpool10)
-        )
-        mixed5a_pool_pad = F.pad(maxpool10, (1, 1, 1, 1), value=float("-inf"))
-        mixed5a_pool = self.mixed5a_pool(
-            mixed5a_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed5a_1x1 = self.mixed5a_1x1(mixed5a_1x1_pre_relu_conv)
-        mixed5a_3x3_bottleneck = self.mixed5a_3x3_bottleneck(
-            mixed5a_3x3_bottleneck_pre_relu_conv
-        )
-        mixed5a_5x5_bottleneck = self.mixed5a_5x5_bottleneck(
-            mixed5a_5x5_bottleneck_pre_relu_conv
-        )
-        mixed5a_pool_reduce_pre_relu_conv = self.mixed5a_pool_reduce_pre_relu_conv(
-            mixed5a_pool
-        )
-        mixed5a_3x3_pre_relu_conv_pad = F.pad(mixed5a_3x3_bottleneck, (1, 1, 1, 1))
-        mixed5a_3x3_pre_relu_conv = self.mixed5a_3x3_pre_relu_conv(
-            mixed5a_3x3_pre_relu_conv_pad
-        )
-        mixed5a_5x5_pre_relu_conv_pad = F.pad(mixed5a_5x5_bottleneck, (2, 2, 2, 2))
-        mixed5a_5x5_pre_relu_conv = self.mixed5a_5x5_pre_relu_conv(
-            mixed5a_5x5_pre_relu_conv_pad
-        )
-        mixed5a_pool_reduce = self.mixed5a_pool_reduce(
-            mixed5a_pool_reduce_pre_relu_conv
-        )
-        mixed5a_3x3 = self.mixed5a_3x3(mixed5a_3x3_pre_relu_conv)
-        mixed5a_5x5 = self.mixed5a_5x5(mixed5a_5x5_pre_relu_conv)
-        mixed5a = self.mixed5a(
-            (mixed5a_1x1, mixed5a_3x3, mixed5a_5x5, mixed5a_pool_reduce), 1
-        )
-        mixed5b_1x1_pre_relu_conv = self.mixed5b_1x1_pre_relu_conv(mixed5a)
-        mixed5b_3x3_bottleneck_pre_relu_conv = (
-            self.mixed5b_3x3_bottleneck_pre_relu_conv(mixed5a)
-        )
-        mixed5b_5x5_bottleneck_pre_relu_conv = (
-            self.mixed5b_5x5_bottleneck_pre_relu_conv(mixed5a)
-        )
-        mixed5b_pool_pad = F.pad(mixed5a, (1, 1, 1, 1), value=float("-inf"))
-        mixed5b_pool = self.mixed5b_pool(
-            mixed5b_pool_pad,
-            kernel_size=(3, 3),
-            stride=(1, 1),
-            padding=0,
-            ceil_mode=False,
-        )
-        mixed5b_1x1 = self.mixed5b_1x1(mixed5b_1x1_pre_relu_conv)
-        mixed5b_3x3_bottleneck = self.mixed5b_3x3_bottleneck(
-            mixed5b_3x3_bottleneck_pre_relu_conv
-        )
-        mixed5b_5x5_bottleneck = self.mixed5b_5x5_bottleneck(
-            mixed5b_5x5_bottleneck_pre_relu_conv
-        )
-        mixed5b_pool_reduce_pre_relu_conv = self.mixed5b_pool_reduce_pre_relu_conv(
-            mixed5b_pool
-        )
-        mixed5b_3x3_pre_relu_conv_pad = F.pad(mixed5b_3x3_bottleneck, (1, 1, 1, 1))
-        mixed5b_3x3_pre_relu_conv = self.mixed5b_3x3_pre_relu_conv(
-            mixed5b_3x3_pre_relu_conv_pad
-        )
-        mixed5b_5x5_pre_relu_conv_pad = F.pad(mixed5b_5x5_bottleneck, (2, 2, 2, 2))
-        mixed5b_5x5_pre_relu_conv = self.mixed5b_5x5_pre_relu_conv(
-            mixed5b_5x5_pre_relu_conv_pad
-        )
-        mixed5b_pool_reduce = self.mixed5b_pool_reduce(
-            mixed5b_pool_reduce_pre_relu_conv
-        )
-        mixed5b_3x3 = self.mixed5b_3x3(mixed5b_3x3_pre_relu_conv)
-        mixed5b_5x5 = self.mixed5b_5x5(mixed5b_5x5_pre_relu_conv)
-        mixed5b = self.mixed5b(
-            (mixed5b_1x1, mixed5b_3x3, mixed5b_5x5, mixed5b_pool_reduce), 1
-        )
-        avgpool0 = F.avg_pool2d(
-            mixed5b,
-            kernel_size=(7, 7),
-            stride=(1, 1),
-            padding=(0,),
-            ceil_mode=False,
-            count_include_pad=False,
+    def fuse_conv_relu(self):
+        """Fuses every `*_pre_relu_conv` convolution with the ReLU that follows it.
+
+        Each convolution is replaced by a `ConvReLU2d` sharing the same parameters and the ReLU layer by an `nn.Identity`, so the ReLU is applied in place on the convolution output instead of writing a second activation tensor. Note that after fusion the `*_pre_relu_conv` layers return the activations after the ReLU.
+
+        Returns
+        -------
+        InceptionV1
+            The model itself, to allow chaining.
+
+        Raises
+        ------
+        ValueError
+            If the model uses redirected ReLUs, whose custom backward can not be fused.
+        """
+        if self.redirected_ReLU:
+            raise ValueError(
+                "Conv+ReLU fusion is not supported with `redirected_ReLU=True` as `RedirectedReLU` has a custom backward."
+            )
+
+        for name, module in list(self.named_children()):
+            if not name.endswith("_pre_relu_conv") or isinstance(module, ConvReLU2d):
+                continue
+            fused = ConvReLU2d(
+                in_channels=module.in_channels,
+                out_channels=module.out_channels,
+                kernel_size=module.kernel_size,
+                stride=module.stride,
+                padding=module.padding,
+                groups=module.groups,
+                bias=module.bias is not None,
+                device="meta",
+            )
+            # share the parameters instead of copying them
+            fused.weight = module.weight
+            fused.bias = module.bias
+            setattr(self, name, fused)
+            setattr(self, name[: -len("_pre_relu_conv")], nn.Identity())
+        return self
+
+    def fuse_for_inference(self):
+        """Fuses the layers of the model for inference.
+
+        Every `*_pre_relu_conv` convolution is fused with the ReLU that follows it, see `fuse_conv_relu`, and the 1x1 convolutions applied to the input of each mixed block are fused into a single convolution, see `fuse_branches`. The model has no batch normalization layers, as they were already folded into the convolution biases of the original TensorFlow graph, so there is no Conv+BN folding to do.
+
+        Returns
+        -------
+        InceptionV1
+            The model itself, to allow chaining.
+
+        Raises
+        ------
+        ValueError
+            If the model uses redirected ReLUs, whose custom backward can not be fused.
+        """
+        self.fuse_conv_relu()
+        return self.fuse_branches()
+
+    def fuse_branches(self):
+        """Fuses the 1x1 convolutions of every mixed block that read the block input into a single convolution.
+
+        The `1x1`, `3x3_bottleneck` and `5x5_bottleneck` convolutions of a mixed block are all applied to the same input, so their weights are concatenated into one larger convolution whose output is split back into the three branches. This reads the input once and runs one large GEMM instead of three small ones. The `pool_reduce` convolution is applied to the pooled input and is not fused.
+
+        The fused weights are copies stored as non-persistent buffers, so the state dict is unchanged but this must be called after the weights are loaded. Note that the forward hooks of the fused `*_pre_relu_conv` layers are not called anymore.
+
+        Returns
+        -------
+        InceptionV1
+            The model itself, to allow chaining.
+        """
+        for block in MIXED_BLOCKS:
+            convs = [
+                getattr(self, f"{block}_{branch}_pre_relu_conv")
+                for branch in REDUCE_BRANCHES
+            ]
+            weight = torch.cat([conv.weight.detach() for conv in convs])
+            bias = torch.cat([conv.bias.detach() for conv in convs])
+            self.register_buffer(f"{block}_reduce_weight", weight, persistent=False)
+            self.register_buffer(f"{block}_reduce_bias", bias, persistent=False)
+            self._fused_branches[block] = [conv.out_channels for conv in convs]
+        self.graph = self.build_graph()
+        return self
+
+    def _reduce_branches(self, block, tensor):
+        """Applies the fused `1x1`, `3x3_bottleneck` and `5x5_bottleneck` convolutions of a mixed block."""
+        out = F.conv2d(
+            tensor,
+            getattr(self, f"{block}_reduce_weight"),
+            getattr(self, f"{block}_reduce_bias"),
         )
-        avgpool0_reshape = torch.reshape(input=avgpool0, shape=(-1, 1024))
-        softmax2_pre_activation_matmul = self.softmax2_pre_activation_matmul(
-            avgpool0_reshape
+        # the ReLUs are identities once `fuse_conv_relu` has been called
+        if isinstance(getattr(self, f"{block}_1x1_pre_relu_conv"), ConvReLU2d):
+            out = F.relu(out, inplace=True)
+        return torch.split(out, self._fused_branches[block], dim=1)
+
+    def to_onnx(
+        self,
+        path: str = "inceptionv1.onnx",
+        batch_size: int = 1,
+        image_size: int = 224,
+        opset_version: int = 17,
+    ) -> str:
+        """Exports the model to ONNX for inference with an optimized runtime.
+
+        The exported graph can be turned into a TensorRT engine, which fuses the conv, bias, ReLU and concat ops and selects FP16 Tensor Core kernels, with e.g. `trtexec --onnx=inceptionv1.onnx --fp16`. Note that such engines only run the forward pass, so they can not be used for feature visualization, which needs the gradient with respect to the input.
+
+        Parameters
+        ----------
+        path : str, optional
+            The path to save the ONNX model to, by default "inceptionv1.onnx".
+        batch_size : int, optional
+            The batch size of the exported model, by default 1.
+        image_size : int, optional
+            The height and width of the input images, by default 224.
+        opset_version : int, optional
+            The ONNX opset version to export with, by default 17.
+
+        Returns
+        -------
+        str
+            The path of the saved ONNX model.
+        """
+        device = next(self.parameters()).device
+        dummy_input = torch.randn(batch_size, 3, image_size, image_size, device=device)
+        with torch.no_grad():
+            torch.onnx.export(
+                self,
+                dummy_input,
+                path,
+                opset_version=opset_version,
+                input_names=["input"],
+                output_names=["softmax2"],
+            )
+        return path
+
+    def trace_(self):
+        """Replaces the graph interpreter of the forward pass in place by a `torch.fx` trace of it.
+
+        The trace is a flat sequence of the layer calls and functional ops, so running it does not go through the graph nodes, the dictionary of outputs and the module lookups on every call. Every layer is kept as a single call in the trace, so the forward hooks registered on the layers are still called. As the layers are captured when tracing, this must be called after `fuse_for_inference`, `fuse_conv_relu` or `fuse_branches`. The model can still be moved to another device or dtype after tracing.
+
+        Returns
+        -------
+        InceptionV1
+            The model itself, to allow chaining.
+        """
+        traced = torch.fx.GraphModule(self, _LayerTracer().trace(self))
+        # the tensors read by the trace, e.g. the buffers of `fuse_branches`
+        attributes = [
+            node.target for node in traced.graph.nodes if node.op == "get_attr"
+        ]
+
+        # keep the traced module out of the submodules and the state dict
+        def _forward(x):
+            # moving the model with e.g. `.to()` replaces its buffers, so read the current ones
+            for name in attributes:
+                setattr(traced, name, getattr(self, name))
+            return traced(x)
+
+        self._forward = _forward
+        return self
+
+    def compile_(
+        self,
+        mode: str = "reduce-overhead",
+        fullgraph: bool = False,
+        backend: str = "inductor",
+    ):
+        """Compiles the forward pass in place using `torch.compile`.
+
+        The forward pass is a long static sequence of small ops, so TorchInductor can fuse the pad/conv/relu chains and the parallel branches of each mixed block into far fewer kernels, and the graph interpreter loop of `forward` is unrolled away at trace time. Feature visualization uses a fixed input shape, so the batch dimension is marked static to avoid recompilation across iterations.
+
+        Parameters
+        ----------
+        mode : str, optional
+            The compilation mode passed to `torch.compile`, by default "reduce-overhead" which is the recommended mode for small models and batches. With "max-autotune", TorchInductor also benchmarks its Triton convolution templates against cuDNN for each fixed input shape, which helps layers cuDNN handles poorly such as the 3 channel 7x7 stride 2 `conv2d0_pre_relu_conv`, and generates the backward needed for feature visualization as well.
+        fullgraph : bool, optional
+            Whether to require the whole forward to compile into a single graph, by default False. Forward hooks with Python side effects (such as the ones added by `torchlight.objective.Hook`) cause graph breaks, so only use True when no hooks are registered.
+        backend : str, optional
+            The `torch.compile` backend, by default "inductor". `mode` is only passed to the inductor backend, e.g. "cudagraphs" can be used to only remove the launch overhead without generating kernels.
+
+        Returns
+        -------
+        InceptionV1
+            The model itself, to allow chaining.
+        """
+        compiled_forward = torch.compile(
+            self.forward,
+            mode=mode if backend == "inductor" else None,
+            fullgraph=fullgraph,
+            backend=backend,
         )
-        softmax2 = self.softmax2(softmax2_pre_activation_matmul)
-        return softmax2
+
+        def forward(x):
+            torch._dynamo.mark_static(x, 0)
+            return compiled_forward(x)
+
+        self.forward = forward
+        return self
+
+    def forward(self, x):
+        x = x.to(
+            dtype=self.conv2d0_pre_relu_conv.weight.dtype,
+            memory_format=torch.channels_last,
+        )
+        # a disabled autocast context would switch off the autocast opened by the caller
+        autocast = (
+            nullcontext()
+            if self.autocast_dtype is None
+            else torch.autocast(device_type=x.device.type, dtype=self.autocast_dtype)
+        )
+        with autocast:
+            return self._forward(x)
+
+    def build_graph(self):
+        """Builds the computation graph run by `forward`.
+
+        The graph is a list of `(name, op, inputs)` nodes in execution order, it is rebuilt by `fuse_branches`. `name` is the name of the node output (a tuple of names for ops with several outputs) and `inputs` are the names of the outputs the op is called with, the model input being named "input". When `op` is None the node calls the submodule named `name`, looked up at call time so the forward hooks keyed by layer name fire and layers replaced by e.g. `fuse_conv_relu` are picked up.
+
+        Returns
+        -------
+        list
+            The list of `(name, op, inputs)` nodes.
+        """
+        local_response_norm = partial(
+            _local_response_norm, size=9, alpha=9.99999974738e-05, beta=0.5, k=1
+        )
+        graph = [
+            ("conv2d0_pre_relu_conv_pad", partial(F.pad, pad=(2, 3, 2, 3)), ("input",)),
+            ("conv2d0_pre_relu_conv", None, ("conv2d0_pre_relu_conv_pad",)),
+            ("conv2d0", None, ("conv2d0_pre_relu_conv",)),
+            ("maxpool0", None, ("conv2d0",)),
+            ("localresponsenorm0", local_response_norm, ("maxpool0",)),
+            ("conv2d1_pre_relu_conv", None, ("localresponsenorm0",)),
+            ("conv2d1", None, ("conv2d1_pre_relu_conv",)),
+            ("conv2d2_pre_relu_conv", None, ("conv2d1",)),
+            ("conv2d2", None, ("conv2d2_pre_relu_conv",)),
+            ("localresponsenorm1", local_response_norm, ("conv2d2",)),
+            ("maxpool1", None, ("localresponsenorm1",)),
+        ]
+
+        block_input = "maxpool1"
+        for block in MIXED_BLOCKS:
+            reduce_names = tuple(
+                f"{block}_{branch}_pre_relu_conv" for branch in REDUCE_BRANCHES
+            )
+            if block in self._fused_branches:
+                graph.append(
+                    (
+                        reduce_names,
+                        partial(self._reduce_branches, block),
+                        (block_input,),
+                    )
+                )
+            else:
+                graph += [(name, None, (block_input,)) for name in reduce_names]
+            graph += [
+                (f"{block}_pool", None, (block_input,)),
+                (f"{block}_1x1", None, (f"{block}_1x1_pre_relu_conv",)),
+                (
+                    f"{block}_3x3_bottleneck",
+                    None,
+                    (f"{block}_3x3_bottleneck_pre_relu_conv",),
+                ),
+                (
+                    f"{block}_5x5_bottleneck",
+                    None,
+                    (f"{block}_5x5_bottleneck_pre_relu_conv",),
+                ),
+                (f"{block}_pool_reduce_pre_relu_conv", None, (f"{block}_pool",)),
+                (f"{block}_3x3_pre_relu_conv", None, (f"{block}_3x3_bottleneck",)),
+                (f"{block}_5x5_pre_relu_conv", None, (f"{block}_5x5_bottleneck",)),
+                (f"{block}_pool_reduce", None, (f"{block}_pool_reduce_pre_relu_conv",)),
+                (f"{block}_3x3", None, (f"{block}_3x3_pre_relu_conv",)),
+                (f"{block}_5x5", None, (f"{block}_5x5_pre_relu_conv",)),
+                (
+                    block,
+                    None,
+                    tuple(f"{block}_{branch}" for branch in CAT_BRANCHES),
+                ),
+            ]
+            block_input = block
+            if block in BLOCK_MAXPOOLS:
+                graph.append((BLOCK_MAXPOOLS[block], None, (block,)))
+                block_input = BLOCK_MAXPOOLS[block]
+
+        graph += [
+            (
+                "avgpool0",
+                partial(
+                    F.avg_pool2d,
+                    kernel_size=(7, 7),
+                    stride=(1, 1),
+                    padding=(0,),
+                    ceil_mode=False,
+                    count_include_pad=False,
+                ),
+                (block_input,),
+            ),
+            (
+                "avgpool0_reshape",
+                partial(torch.reshape, shape=(-1, 1024)),
+                ("avgpool0",),
+            ),
+            ("softmax2_pre_activation_matmul", None, ("avgpool0_reshape",)),
+            ("softmax2", None, ("softmax2_pre_activation_matmul",)),
+        ]
+        return graph
+
+    def _forward(self, x):
+        outputs = {"input": x}
+        for name, op, inputs in self.graph:
+            if op is None:
+                op = self._modules[name]
+            output = op(*[outputs[input_name] for input_name in inputs])
+            if isinstance(name, tuple):
+                # index instead of unpacking so the graph can also be traced with torch.fx
+                outputs.update((n, output[i]) for i, n in enumerate(name))
+            else:
+                outputs[name] = output
+        return outputs["softmax2"]
@@ -218,7 +218,8 @@ class FeatureViz:
                         f"Some layers could not be computed because the size of the image is not big enough. It is fine, as long as the non computed layers are not used in the objective function.\nException: {ex}"
                     )
             loss = self.objective(self.model)
-            loss.backward()
+            # only the image is optimized, so skip computing and allocating the gradients of the model weights
+            loss.backward(inputs=params)
 
             if self.normalize_gradients:
                 self.normalize_grad(params)
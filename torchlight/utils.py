@@ -8,7 +8,6 @@ import matplotlib.axes
 from typing import List, Union, Any, Callable, Optional, Dict
 import logging
 from PIL import Image
-from IPython.display import display
 from collections import OrderedDict
 
 
@@ -178,6 +177,8 @@ class ImagePlotter:
         plt.pause(0.01)
         # display the figure if running in a Jupyter notebook
         if is_jupyter_notebook():
+            from IPython.display import display
+
             display(self.fig, clear=True)
         if path_to_save is not None:
             self.fig.savefig(path_to_save)